@@ -1,120 +1,315 @@
-from fastapi import FastAPI, Query
-from fastapi.middleware.cors import CORSMiddleware
-import requests
-from geopy.distance import geodesic
-import math
-
-app = FastAPI(
-    title="Earthquake Impact Checker",
-    description="Real-time earthquakes + impact for your location",
-    version="5.0"
-)
-
-# CORS
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-# -----------------------------
-USGS_FEED = "https://earthquake.usgs.gov/earthquakes/feed/v1.0/summary/all_hour.geojson"
-
-# -----------------------------
-# Impact scoring
-# -----------------------------
-def impact_score(magnitude, distance_km, building_type):
-    building_factor = {"house":0,"apartment":1,"old_building":2}.get(building_type,0)
-    distance_factor = max(0, 10 - math.log10(distance_km + 1) * 3)
-    score = magnitude*10 + distance_factor + building_factor
-    return round(score,1)
-
-def impact_level(score):
-    if score < 30: return "Low"
-    elif score < 60: return "Medium"
-    else: return "High"
-
-def felt_intensity(score):
-    if score < 30: return "Barely felt"
-    elif score < 60: return "Noticeable shaking"
-    else: return "Potential damage"
-
-def confidence_statement(score):
-    if score < 10: return "You are very unlikely to notice any earthquake activity."
-    elif score < 50: return "Some people may feel shaking."
-    else: return "There is a realistic chance of noticeable shaking."
-
-# -----------------------------
-# Endpoint: Impact at user location
-# -----------------------------
-@app.get("/impact")
-def check_impact(
-    lat: float = Query(..., description="Your latitude"),
-    lon: float = Query(..., description="Your longitude"),
-    building: str = Query("house", description="house | apartment | old_building")
-):
-    try:
-        data = requests.get(USGS_FEED, timeout=10).json()
-    except:
-        return {"error":"Cannot fetch earthquake data."}
-
-    nearby_quakes = []
-    for q in data.get("features", []):
-        mag = q["properties"].get("mag")
-        if mag is None or mag < 3: continue
-        q_lon, q_lat, depth = q["geometry"]["coordinates"]
-        dist = geodesic((lat,lon),(q_lat,q_lon)).km
-        if dist < 1000:
-            nearby_quakes.append((q,dist))
-
-    if not nearby_quakes:
-        return {
-            "status": "No relevant earthquakes near your location",
-            "impact_level": "Low",
-            "impact_score": 0,
-            "felt_intensity": "None",
-            "confidence": "No earthquake activity near you is expected to be felt.",
-            "why": "No earthquakes of magnitude 3.0+ occurred within 1000 km in the last hour.",
-            "what_to_do":["No action needed","Stay informed for future alerts","Ensure general emergency preparedness"]
-        }
-
-    quake, distance_km = min(nearby_quakes, key=lambda x:x[1])
-    q_lon, q_lat, depth = quake["geometry"]["coordinates"]
-    magnitude = quake["properties"]["mag"]
-    place = quake["properties"]["place"]
-    score = impact_score(magnitude,distance_km,building)
-
-    return {
-        "earthquake":{"magnitude":magnitude,"place":place,"depth_km":abs(round(depth,1))},
-        "your_location":{"latitude":lat,"longitude":lon},
-        "distance_km":round(distance_km,1),
-        "impact_score":score,
-        "impact_level":impact_level(score),
-        "felt_intensity":felt_intensity(score),
-        "confidence":confidence_statement(score),
-        "why":"This is the closest significant earthquake to your location.",
-        "what_to_do":["Stay calm and informed","Secure loose objects nearby","Check emergency supplies"]
-    }
-
-# -----------------------------
-# Endpoint: List recent earthquakes with epicenter
-# -----------------------------
-@app.get("/latest")
-def latest_quakes():
-    try:
-        data = requests.get(USGS_FEED, timeout=10).json()
-    except:
-        return {"error":"Cannot fetch earthquake data."}
-
-    quakes = []
-    for q in data.get("features", []):
-        mag = q["properties"].get("mag")
-        place = q["properties"].get("place")
-        depth = q["geometry"]["coordinates"][2]
-        lat = q["geometry"]["coordinates"][1]
-        lon = q["geometry"]["coordinates"][0]
-        quakes.append({"place":place,"magnitude":mag,"depth_km":round(depth,1),"latitude":lat,"longitude":lon})
-
-    return {"earthquakes":quakes}
+from fastapi import FastAPI, HTTPException, Query
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel
+from dataclasses import dataclass
+from geographiclib.geodesic import Geodesic
+from numba import njit
+from scoring import CONFIGS, DEFAULT_VERSION, impact_score, impact_level, felt_intensity, confidence_statement
+from responses import (ImpactResponse, BatchImpactResponse, Earthquake, Location,
+                       _WHY_NEARBY, _WHY_NONE, _ACTIONS_NEARBY, _ACTIONS_NONE)
+import httpx
+import ijson
+import numpy as np
+import math
+import time
+import asyncio
+
+app = FastAPI(
+    title="Earthquake Impact Checker",
+    description="Real-time earthquakes + impact for your location",
+    version="5.0",
+    default_response_class=ORJSONResponse
+)
+
+# CORS
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+# -----------------------------
+USGS_FEED = "https://earthquake.usgs.gov/earthquakes/feed/v1.0/summary/all_hour.geojson"
+GEOD = Geodesic.WGS84
+FEED_TTL = 60  # seconds; the all_hour feed only updates about once a minute
+TILE_CELLS = 1_000_000  # cap on users x quakes cells per batch distance tile
+MAX_KM = 1000.0
+# Squared unit-sphere chord length equivalent to MAX_KM: chord = 2*sin(d/2R).
+# Monotone in distance, so ranking and thresholding work on chord**2 directly.
+MAX_CHORD2 = (2.0*math.sin(MAX_KM/(2.0*6371.0)))**2
+
+client: httpx.AsyncClient = None
+
+@app.on_event("startup")
+async def startup():
+    global client
+    client = httpx.AsyncClient(timeout=10)
+    # Warm the JIT so the compile cost isn't paid on the first real request
+    nearest_within(np.zeros(1), np.zeros(1), np.zeros(1), np.zeros(1), 1.0, 0.0, 0.0, 3.0, MAX_CHORD2)
+
+@app.on_event("shutdown")
+async def shutdown():
+    await client.aclose()
+
+# Upstream failures we translate into a 502; anything else (bad imports,
+# kernel bugs, cancellation) propagates instead of masquerading as a feed error
+FEED_ERRORS = (httpx.HTTPError, ijson.JSONError)
+
+@app.exception_handler(502)
+async def feed_error_handler(request, exc):
+    return ORJSONResponse({"error": exc.detail}, status_code=502)
+
+# -----------------------------
+# Feed cache: one upstream fetch per TTL window, shared by all requests.
+# The feed is stored as parallel arrays (SoA) built once per fetch, so
+# per-request work never touches the GeoJSON dicts.
+# -----------------------------
+@dataclass(slots=True)
+class Feed:
+    lons: np.ndarray
+    lats: np.ndarray
+    depths: np.ndarray
+    mags: np.ndarray
+    places: list
+    # Unit-sphere coordinates of each epicenter, precomputed once per fetch
+    xs: np.ndarray
+    ys: np.ndarray
+    zs: np.ndarray
+
+_feed_cache = {"ts": 0.0, "feed": None, "etag": None, "last_modified": None}
+_feed_lock = asyncio.Lock()
+
+async def fetch_feed():
+    # Stream-parse the payload one feature at a time: each GeoJSON dict is
+    # reduced to its array row and discarded, so the full tree is never held.
+    # The request is conditional: USGS honours ETag/If-Modified-Since, and a
+    # 304 lets us keep the already-parsed arrays without re-downloading.
+    headers = {}
+    if _feed_cache["etag"]:
+        headers["If-None-Match"] = _feed_cache["etag"]
+    if _feed_cache["last_modified"]:
+        headers["If-Modified-Since"] = _feed_cache["last_modified"]
+
+    lons = []; lats = []; depths = []; mags = []; places = []
+
+    def drain(features):
+        for q in features:
+            qlon, qlat, qdepth = q["geometry"]["coordinates"]
+            props = q["properties"]
+            m = props.get("mag")
+            lons.append(qlon); lats.append(qlat); depths.append(qdepth)
+            mags.append(m if m is not None else math.nan)
+            places.append(props.get("place"))
+        del features[:]
+
+    features = ijson.sendable_list()
+    coro = ijson.items_coro(features, "features.item", use_float=True)
+    async with client.stream("GET", USGS_FEED, headers=headers) as resp:
+        if resp.status_code == 304 and _feed_cache["feed"] is not None:
+            return _feed_cache["feed"], _feed_cache["etag"], _feed_cache["last_modified"]
+        # A 5xx with a JSON error body would otherwise parse to an empty
+        # feed and be cached as "no earthquakes" for a full TTL
+        resp.raise_for_status()
+        etag = resp.headers.get("ETag")
+        last_modified = resp.headers.get("Last-Modified")
+        async for chunk in resp.aiter_bytes():
+            coro.send(chunk)
+            drain(features)
+    coro.close()
+    drain(features)
+
+    phi = np.radians(np.array(lats))
+    lmb = np.radians(np.array(lons))
+    cphi = np.cos(phi)
+    feed = Feed(
+        lons=np.array(lons), lats=np.array(lats),
+        depths=np.array(depths), mags=np.array(mags),
+        places=places,
+        xs=cphi*np.cos(lmb), ys=cphi*np.sin(lmb), zs=np.sin(phi),
+    )
+    return feed, etag, last_modified
+
+async def get_feed():
+    # The lock makes N concurrent callers await one upstream fetch, not N
+    async with _feed_lock:
+        if _feed_cache["feed"] is not None and time.monotonic() - _feed_cache["ts"] < FEED_TTL:
+            return _feed_cache["feed"]
+        # Validators are stored only here, together with the feed they
+        # describe, so a failed parse can never leave an ETag pointing at
+        # data we do not have
+        feed, etag, last_modified = await fetch_feed()
+        _feed_cache["ts"] = time.monotonic()
+        _feed_cache["feed"] = feed
+        _feed_cache["etag"] = etag
+        _feed_cache["last_modified"] = last_modified
+        return feed
+
+# -----------------------------
+# Distance kernel
+# -----------------------------
+# fastmath must not include 'nnan': that flag lets LLVM assume no NaNs and
+# compiles away the missing-magnitude guard below
+@njit(cache=True, fastmath={'contract', 'arcp', 'nsz', 'afn', 'reassoc'})
+def nearest_within(xs, ys, zs, mags, x0, y0, z0, min_mag, max_chord2):
+    """Fused chord-distance + argmin: one pass, no intermediate arrays.
+
+    Ranks by squared unit-sphere chord distance, which is monotone in great-
+    circle distance, so no trig is needed per quake -- just multiplies and
+    adds, which SIMD-vectorize cleanly. Returns (index, chord2) of the
+    closest quake with mag >= min_mag within max_chord2, or (-1, max_chord2).
+    The former degree-box reject is gone: branches would cost more than the
+    arithmetic they skip.
+    """
+    best_idx = -1
+    best = max_chord2
+    for i in range(xs.shape[0]):
+        if not (mags[i] >= min_mag):  # also rejects NaN magnitudes
+            continue
+        dx = xs[i] - x0
+        dy = ys[i] - y0
+        dz = zs[i] - z0
+        c2 = dx*dx + dy*dy + dz*dz
+        if c2 < best:
+            best = c2
+            best_idx = i
+    return best_idx, best
+
+# -----------------------------
+# Response builders, shared by /impact and /impact/batch
+# -----------------------------
+def no_quake_response():
+    return ImpactResponse(
+        status="No relevant earthquakes near your location",
+        impact_level="Low",
+        impact_score=0,
+        felt_intensity="None",
+        confidence="No earthquake activity near you is expected to be felt.",
+        why=_WHY_NONE,
+        what_to_do=_ACTIONS_NONE
+    )
+
+def impact_response(feed, idx, lat, lon, building, config):
+    q_lat, q_lon = float(feed.lats[idx]), float(feed.lons[idx])
+    depth = float(feed.depths[idx])
+    # Haversine ranked the candidates; report the winner Karney-exact,
+    # calling geographiclib directly (no per-call geopy wrapper objects)
+    distance_km = GEOD.Inverse(lat, lon, q_lat, q_lon, outmask=Geodesic.DISTANCE)["s12"] / 1000.0
+    magnitude = float(feed.mags[idx])
+    place = feed.places[idx]
+    score = impact_score(magnitude, distance_km, building, config)
+
+    return ImpactResponse(
+        earthquake=Earthquake(magnitude=magnitude, place=place, depth_km=abs(round(depth,1))),
+        your_location=Location(latitude=lat, longitude=lon),
+        distance_km=round(distance_km,1),
+        impact_score=score,
+        impact_level=impact_level(score, config),
+        felt_intensity=felt_intensity(score, config),
+        confidence=confidence_statement(score, config),
+        why=_WHY_NEARBY,
+        what_to_do=_ACTIONS_NEARBY
+    )
+
+# -----------------------------
+# Endpoint: Impact at user location
+# -----------------------------
+@app.get("/impact", response_model=ImpactResponse, response_model_exclude_none=True)
+async def check_impact(
+    lat: float = Query(..., description="Your latitude"),
+    lon: float = Query(..., description="Your longitude"),
+    building: str = Query("house", description="house | apartment | old_building"),
+    version: str = Query(DEFAULT_VERSION, description="scoring formula version")
+):
+    config = CONFIGS.get(version, CONFIGS[DEFAULT_VERSION])
+    try:
+        feed = await get_feed()
+    except FEED_ERRORS:
+        raise HTTPException(status_code=502, detail="Cannot fetch earthquake data.")
+
+    phi = math.radians(lat); lmb = math.radians(lon)
+    x0 = math.cos(phi)*math.cos(lmb); y0 = math.cos(phi)*math.sin(lmb); z0 = math.sin(phi)
+    idx, _ = nearest_within(feed.xs, feed.ys, feed.zs, feed.mags, x0, y0, z0, 3.0, MAX_CHORD2)
+    if idx < 0:
+        return no_quake_response()
+    return impact_response(feed, idx, lat, lon, building, config)
+
+# -----------------------------
+# Endpoint: Impact for many locations in one call
+# -----------------------------
+class UserLoc(BaseModel):
+    lat: float
+    lon: float
+    building: str = "house"
+
+def nearest_batch(feed, ulat, ulon):
+    """Closest in-range quake per user via a tiled broadcast chord distance.
+
+    Returns an int array of quake indices, -1 where no quake qualifies.
+    Tiles the users x quakes matrix to at most TILE_CELLS cells so memory
+    stays O(users + quakes) per tile. Like nearest_within, ranking uses
+    squared unit-sphere chord distances: pure multiply-add, no trig per cell.
+    """
+    xs, ys, zs, mags = feed.xs, feed.ys, feed.zs, feed.mags
+    best = np.full(ulat.shape[0], -1, dtype=np.int64)
+    if xs.size == 0:
+        return best
+    valid = mags >= 3
+    phi = np.radians(ulat); lmb = np.radians(ulon)
+    cphi = np.cos(phi)
+    ux = cphi*np.cos(lmb); uy = cphi*np.sin(lmb); uz = np.sin(phi)
+    rows = max(1, TILE_CELLS // xs.size)
+    for start in range(0, ulat.shape[0], rows):
+        sl = slice(start, start + rows)
+        c2 = ((xs[None, :] - ux[sl][:, None])**2
+              + (ys[None, :] - uy[sl][:, None])**2
+              + (zs[None, :] - uz[sl][:, None])**2)
+        c2 = np.where(valid[None, :] & (c2 < MAX_CHORD2), c2, np.inf)
+        idx = np.argmin(c2, axis=1)
+        hit = np.isfinite(c2[np.arange(idx.shape[0]), idx])
+        best[sl] = np.where(hit, idx, -1)
+    return best
+
+@app.post("/impact/batch", response_model=BatchImpactResponse, response_model_exclude_none=True)
+async def check_impact_batch(
+    users: list[UserLoc],
+    version: str = Query(DEFAULT_VERSION, description="scoring formula version")
+):
+    config = CONFIGS.get(version, CONFIGS[DEFAULT_VERSION])
+    try:
+        feed = await get_feed()
+    except FEED_ERRORS:
+        raise HTTPException(status_code=502, detail="Cannot fetch earthquake data.")
+
+    ulat = np.array([u.lat for u in users])
+    ulon = np.array([u.lon for u in users])
+    best = nearest_batch(feed, ulat, ulon)
+    return BatchImpactResponse(results=[
+        impact_response(feed, int(idx), u.lat, u.lon, u.building, config) if idx >= 0 else no_quake_response()
+        for u, idx in zip(users, best)
+    ])
+
+# -----------------------------
+# Endpoint: List recent earthquakes with epicenter
+# -----------------------------
+@app.get("/latest")
+async def latest_quakes():
+    try:
+        feed = await get_feed()
+    except FEED_ERRORS:
+        raise HTTPException(status_code=502, detail="Cannot fetch earthquake data.")
+
+    quakes = []
+    for i, place in enumerate(feed.places):
+        mag = float(feed.mags[i])
+        quakes.append({
+            "place": place,
+            "magnitude": None if math.isnan(mag) else mag,
+            "depth_km": round(float(feed.depths[i]),1),
+            "latitude": float(feed.lats[i]),
+            "longitude": float(feed.lons[i])
+        })
+
+    return {"earthquakes":quakes}
@@ -0,0 +1,32 @@
+from pydantic import BaseModel
+
+# Static response text, shared by reference across every response so the
+# serializer never copies per-request
+_WHY_NEARBY = "This is the closest significant earthquake to your location."
+_WHY_NONE = "No earthquakes of magnitude 3.0+ occurred within 1000 km in the last hour."
+_ACTIONS_NEARBY = ["Stay calm and informed","Secure loose objects nearby","Check emergency supplies"]
+_ACTIONS_NONE = ["No action needed","Stay informed for future alerts","Ensure general emergency preparedness"]
+
+class Earthquake(BaseModel):
+    magnitude: float
+    place: str | None
+    depth_km: float
+
+class Location(BaseModel):
+    latitude: float
+    longitude: float
+
+class ImpactResponse(BaseModel):
+    status: str | None = None
+    earthquake: Earthquake | None = None
+    your_location: Location | None = None
+    distance_km: float | None = None
+    impact_score: float
+    impact_level: str
+    felt_intensity: str
+    confidence: str
+    why: str
+    what_to_do: list[str]
+
+class BatchImpactResponse(BaseModel):
+    results: list[ImpactResponse]
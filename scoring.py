@@ -0,0 +1,58 @@
+from bisect import bisect_right
+from dataclasses import dataclass
+from functools import lru_cache
+import math
+
+# -----------------------------
+# Scoring configuration
+# -----------------------------
+@dataclass(frozen=True)
+class ScoringConfig:
+    magnitude_weight: float = 10.0
+    distance_base: float = 10.0
+    distance_weight: float = 3.0
+    level_thresholds: tuple = (30, 60)
+    level_labels: tuple = ("Low", "Medium", "High")
+    intensity_thresholds: tuple = (30, 60)
+    intensity_labels: tuple = ("Barely felt", "Noticeable shaking", "Potential damage")
+    confidence_thresholds: tuple = (10, 50)
+    confidence_labels: tuple = (
+        "You are very unlikely to notice any earthquake activity.",
+        "Some people may feel shaking.",
+        "There is a realistic chance of noticeable shaking.",
+    )
+
+# Named formula versions selectable via /impact?version=...
+CONFIGS = {"v1": ScoringConfig()}
+DEFAULT_VERSION = "v1"
+
+_BUILDING_FACTOR = {"house": 0, "apartment": 1, "old_building": 2}
+
+# -----------------------------
+# Impact scoring
+# -----------------------------
+def impact_score(magnitude, distance_km, building_type, config=CONFIGS[DEFAULT_VERSION]):
+    # Quantize to 0.1 units: at the Low/Medium/High granularity reported the
+    # effective input cardinality is small, so the cache absorbs the log10
+    return _impact_score_cached(building_type, round(magnitude, 1), round(distance_km, 1), config)
+
+@lru_cache(maxsize=4096)
+def _impact_score_cached(building_type, magnitude, distance_km, config):
+    building_factor = _BUILDING_FACTOR.get(building_type, 0)
+    distance_factor = max(0, config.distance_base - math.log10(distance_km + 1) * config.distance_weight)
+    score = magnitude*config.magnitude_weight + distance_factor + building_factor
+    return round(score, 1)
+
+# Labels are picked by bisecting the sorted threshold tuple: bisect_right
+# keeps the original "score < threshold" boundary behaviour.
+@lru_cache(maxsize=1024)
+def impact_level(score, config=CONFIGS[DEFAULT_VERSION]):
+    return config.level_labels[bisect_right(config.level_thresholds, score)]
+
+@lru_cache(maxsize=1024)
+def felt_intensity(score, config=CONFIGS[DEFAULT_VERSION]):
+    return config.intensity_labels[bisect_right(config.intensity_thresholds, score)]
+
+@lru_cache(maxsize=1024)
+def confidence_statement(score, config=CONFIGS[DEFAULT_VERSION]):
+    return config.confidence_labels[bisect_right(config.confidence_thresholds, score)]
@@ -0,0 +1,43 @@
+import math
+
+import numpy as np
+
+import main
+
+
+def make_feed(lats, lons, mags):
+    lats = np.array(lats, dtype=np.float64)
+    lons = np.array(lons, dtype=np.float64)
+    phi = np.radians(lats)
+    lmb = np.radians(lons)
+    cphi = np.cos(phi)
+    return main.Feed(
+        lons=lons, lats=lats,
+        depths=np.zeros(lats.size), mags=np.array(mags, dtype=np.float64),
+        places=[None] * lats.size,
+        xs=cphi*np.cos(lmb), ys=cphi*np.sin(lmb), zs=np.sin(phi),
+    )
+
+
+def test_nearest_within_skips_null_magnitudes():
+    # The nearer quake has mag: null (stored as NaN) and must not win
+    feed = make_feed([0.0, 0.5], [0.0, 0.5], [math.nan, 4.5])
+    idx, _ = main.nearest_within(feed.xs, feed.ys, feed.zs, feed.mags,
+                                 1.0, 0.0, 0.0, 3.0, main.MAX_CHORD2)
+    assert idx == 1
+
+
+def test_nearest_batch_skips_null_magnitudes():
+    feed = make_feed([0.0, 0.5], [0.0, 0.5], [math.nan, 4.5])
+    best = main.nearest_batch(feed, np.array([0.0]), np.array([0.0]))
+    assert best.tolist() == [1]
+
+
+def test_single_and_batch_agree_on_null_magnitudes():
+    feed = make_feed([0.0, 0.5], [0.0, 0.5], [math.nan, 4.5])
+    phi = math.radians(0.0)
+    x0 = math.cos(phi); y0 = 0.0; z0 = math.sin(phi)
+    idx, _ = main.nearest_within(feed.xs, feed.ys, feed.zs, feed.mags,
+                                 x0, y0, z0, 3.0, main.MAX_CHORD2)
+    best = main.nearest_batch(feed, np.array([0.0]), np.array([0.0]))
+    assert idx == int(best[0]) == 1